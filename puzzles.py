@@ -1,6 +1,10 @@
 import argparse
+from contextlib import redirect_stdout
+from functools import lru_cache
+import io
 from typing import List
 import os
+import sys
 
 import torch
 import triton
@@ -9,7 +13,27 @@ import triton.language as tl
 # Local imports
 from display import print_end_line
 from tensor_type import Float32, Int32
-from test_puzzle import test
+from test_puzzle import test, test_async, check
+
+
+def autotune_configs(configs):
+    """Autotuning benchmarks every config on the GPU, which the Triton interpreter
+    cannot do. Only keep the first config (the default block sizes) in interpreter mode."""
+    if os.getenv("TRITON_INTERPRET", "0") == "1":
+        return configs[:1]
+    return configs
+
+
+def prune_configs_by_T(configs, named_args, **kwargs):
+    """Tiered B1 choice for kernels looping over a sequence of length T. A short T only
+    keeps tiles that do not exceed it (less power-of-two padding), a long T only keeps
+    wide tiles (more bytes in flight per iteration)."""
+    T = {**named_args, **kwargs}["T"]
+    if T <= 512:
+        pruned = [config for config in configs if config.kwargs["B1"] <= triton.next_power_of_2(T)]
+    else:
+        pruned = [config for config in configs if config.kwargs["B1"] >= 128]
+    return pruned or configs
 
 
 """
@@ -65,9 +89,9 @@ def demo1(x_ptr):
     print(x)
 
 
-def run_demo1():
+def run_demo1(device="cpu"):
     print("Demo1 Output: ")
-    demo1[(1, 1, 1)](torch.ones(4, 3))
+    demo1[(1, 1, 1)](torch.ones(4, 3, device=device))
     print_end_line()
 
 
@@ -112,9 +136,9 @@ def demo2(x_ptr):
     print(x)
 
 
-def run_demo2():
+def run_demo2(device="cpu"):
     print("Demo2 Output: ")
-    demo2[(1, 1, 1)](torch.ones(4, 4))
+    demo2[(1, 1, 1)](torch.ones(4, 4, device=device))
     print_end_line()
 
 
@@ -148,9 +172,9 @@ def demo3(z_ptr):
     z = tl.store(z_ptr + range, 10, range < 5)
 
 
-def run_demo3():
+def run_demo3(device="cpu"):
     print("Demo3 Output: ")
-    z = torch.ones(4, 3)
+    z = torch.ones(4, 3, device=device)
     demo3[(1, 1, 1)](z)
     print(z)
     print_end_line()
@@ -187,9 +211,9 @@ def demo4(x_ptr):
     print("Print for each", pid, x)
 
 
-def run_demo4():
+def run_demo4(device="cpu"):
     print("Demo4 Output: ")
-    x = torch.ones(2, 4, 4)
+    x = torch.ones(2, 4, 4, device=device)
     demo4[(3, 1, 1)](x)
     print_end_line()
 
@@ -199,6 +223,8 @@ r"""
 
 Add a constant to a vector. Uses one program id axis. 
 Block size `B0` is always the same as vector `x` with length `N0`.
+The `add_kernel` below generalizes this: every program handles one block of `B0` elements and
+masks the part past `N0`, so it also works when `N0` is not a single block.
 
 .. math::
     z_i = 10 + x_i \text{ for } i = 1\ldots N_0
@@ -213,10 +239,13 @@ def add_spec(x: Float32[32,]) -> Float32[32,]:
 @triton.jit
 def add_kernel(x_ptr, z_ptr, N0, B0: tl.constexpr):
     # We name the offsets of the pointers as "off_"
-    off_x = tl.arange(0, B0)
-    x = tl.load(x_ptr + off_x)
+    # Block-strided and masked, so that N0 > B0 spreads over cdiv(N0, B0) programs
+    pid = tl.program_id(0)
+    off_x = pid * B0 + tl.arange(0, B0)
+    mask_x = off_x < N0
+    x = tl.load(x_ptr + off_x, mask=mask_x)
     x = x + 10.0
-    tl.store(z_ptr + off_x, x)
+    tl.store(z_ptr + off_x, x, mask=mask_x)
     return
 
 
@@ -268,15 +297,11 @@ def add_vec_kernel(x_ptr, y_ptr, z_ptr, N0, N1, B0: tl.constexpr, B1: tl.constex
     idx_x = tl.arange(0, B0)
     idx_y = tl.arange(0, B1)
     x_value = tl.load(x_ptr + idx_x)    # Shape: [B0]
-    x_value = tl.expand_dims(x_value, 0).broadcast_to(B1, B0)    # Shape: [B1, B0]
     y_value = tl.load(y_ptr + idx_y)    # Shape: [B1]
-    y_value = tl.expand_dims(y_value, 1).broadcast_to(B1, B0)    # Shape: [B1, B0]
-    z_value = x_value + y_value
-    
+    z_value = x_value[None, :] + y_value[:, None]    # Shape: [B1, B0]
+
     # index compute
-    dim1 = tl.arange(0, B0).expand_dims(0).broadcast_to(B1, B0)
-    dim0 = B0 * tl.arange(0, B1).expand_dims(1).broadcast_to(B1, B0)
-    idx_z = dim0 + dim1
+    idx_z = idx_y[:, None] * B0 + idx_x[None, :]
     tl.store(z_ptr + idx_z, z_value)
     return
 
@@ -310,16 +335,12 @@ def add_vec_block_kernel(
     mask_x = idx_x < N0
     mask_y = idx_y < N1
     x_value = tl.load(x_ptr + idx_x, mask=mask_x)    # Shape: [B0]
-    x_value = tl.expand_dims(x_value, 0).broadcast_to(B1, B0)    # Shape: [B1, B0]
     y_value = tl.load(y_ptr + idx_y, mask=mask_y)    # Shape: [B1]
-    y_value = tl.expand_dims(y_value, 1).broadcast_to(B1, B0)    # Shape: [B1, B0]
-    z_value = x_value + y_value
+    z_value = x_value[None, :] + y_value[:, None]    # Shape: [B1, B0]
 
     # index compute
-    dim1 = (block_id_x * B0 + tl.arange(0, B0)).expand_dims(0).broadcast_to(B1, B0)
-    dim0 = (N0 * (block_id_y * B1 + tl.arange(0, B1))).expand_dims(1).broadcast_to(B1, B0)
-    idx_z = dim0 + dim1
-    mask_z = mask_x.expand_dims(0).broadcast_to(B1, B0) &  mask_y.expand_dims(1).broadcast_to(B1, B0)
+    idx_z = idx_y[:, None] * N0 + idx_x[None, :]
+    mask_z = mask_x[None, :] & mask_y[:, None]
     tl.store(z_ptr + idx_z, z_value, mask=mask_z)
     return
 
@@ -352,17 +373,13 @@ def mul_relu_block_kernel(
     mask_x = idx_x < N0
     mask_y = idx_y < N1
     x_value = tl.load(x_ptr + idx_x, mask=mask_x)    # Shape: [B0]
-    x_value = tl.expand_dims(x_value, 0).broadcast_to(B1, B0)    # Shape: [B1, B0]
     y_value = tl.load(y_ptr + idx_y, mask=mask_y)    # Shape: [B1]
-    y_value = tl.expand_dims(y_value, 1).broadcast_to(B1, B0)    # Shape: [B1, B0]
-    z_value = x_value * y_value
-    z_value = z_value * (z_value > 0)   # ReLU
+    z_value = x_value[None, :] * y_value[:, None]    # Shape: [B1, B0]
+    z_value = tl.maximum(z_value, 0.0)   # ReLU
 
     # index compute
-    dim1 = (block_id_x * B0 + tl.arange(0, B0)).expand_dims(0).broadcast_to(B1, B0)
-    dim0 = (N0 * (block_id_y * B1 + tl.arange(0, B1))).expand_dims(1).broadcast_to(B1, B0)
-    idx_z = dim0 + dim1
-    mask_z = mask_x.expand_dims(0).broadcast_to(B1, B0) & mask_y.expand_dims(1).broadcast_to(B1, B0)
+    idx_z = idx_y[:, None] * N0 + idx_x[None, :]
+    mask_z = mask_x[None, :] & mask_y[:, None]
     tl.store(z_ptr + idx_z, z_value, mask=mask_z)
     return
 
@@ -399,8 +416,10 @@ def mul_relu_block_back_spec(
 
 @triton.jit
 def mul_relu_block_back_kernel(
-    x_ptr, y_ptr, dz_ptr, dx_ptr, N0, N1, B0: tl.constexpr, B1: tl.constexpr
+    x_ptr, y_ptr, dz_ptr, dx_ptr, N0, N1, B0: tl.constexpr, B1: tl.constexpr,
+    ALLOW_NEG: tl.constexpr = True,
 ):
+    """ALLOW_NEG=False promises x * y > 0 everywhere, which compiles the ReLU gate away."""
     block_id_i = tl.program_id(0)
     block_id_j = tl.program_id(1)
 
@@ -409,16 +428,19 @@ def mul_relu_block_back_kernel(
     idx_j = block_id_j * B1 + tl.arange(0, B1)  # Shape: [B1]
     mask_j = idx_j < N1
 
-    idx_ji = N0 * idx_j.expand_dims(1).broadcast_to(B1, B0) + idx_i.expand_dims(0).broadcast_to(B1, B0)
-    mask_ji = mask_i.expand_dims(0).broadcast_to(B1, B0) & mask_j.expand_dims(1).broadcast_to(B1, B0)
+    idx_ji = N0 * idx_j[:, None] + idx_i[None, :]
+    mask_ji = mask_i[None, :] & mask_j[:, None]
 
-    x = tl.load(x_ptr + idx_ji, mask=mask_ji)   # Shape: [B1, B0]
     y = tl.load(y_ptr + idx_j, mask=mask_j)     # Shape: [B1]
-    y_broadcast = y.expand_dims(1).broadcast_to(B1, B0)
-    _mul = x * y_broadcast
-
+    y_broadcast = y[:, None]    # Shape: [B1, 1]
     dz = tl.load(dz_ptr + idx_ji, mask=mask_ji)   # Shape: [B1, B0]
-    dx = dz * tl.where(_mul > 0.0, 1.0, 0.0) * y_broadcast
+
+    # ReLU gate and chain rule in one select: d(relu(x * y))/dx = y where x * y > 0
+    if ALLOW_NEG:
+        x = tl.load(x_ptr + idx_ji, mask=mask_ji)   # Shape: [B1, B0]
+        dx = tl.where(x * y_broadcast > 0.0, dz * y_broadcast, 0.0)
+    else:
+        dx = dz * y_broadcast
     tl.store(dx_ptr + idx_ji, dx, mask=mask_ji)
     return
 
@@ -442,22 +464,37 @@ def sum_spec(x: Float32[4, 200]) -> Float32[4,]:
     return x.sum(1)
 
 
+@triton.autotune(
+    configs=autotune_configs([
+        triton.Config({"B0": b0, "B1": b1}, num_warps=w, num_stages=s)
+        for b0 in [1, 2, 4, 8]
+        for b1 in [32, 64, 128, 256, 512]
+        for (w, s) in [(2, 2), (4, 2), (4, 3), (8, 3)]
+    ]),
+    key=["T"],
+    prune_configs_by={"early_config_prune": prune_configs_by_T},
+)
 @triton.jit
 def sum_kernel(x_ptr, z_ptr, N0, N1, T, B0: tl.constexpr, B1: tl.constexpr):
     block_id_i = tl.program_id(0)
     idx_i = block_id_i * B0 + tl.arange(0, B0)  # Shape: [B0]
     mask_i = idx_i < N0
 
-    sums = tl.zeros((B0,), tl.float32)
+    # Row offsets and row masks do not depend on the T loop
+    idx_i_T = (idx_i * T)[:, None]  # Shape: [B0, 1]
+    mask_i_col = mask_i[:, None]    # Shape: [B0, 1]
+
+    # Accumulate element-wise and reduce across B1 only once after the loop
+    acc = tl.zeros((B0, B1), tl.float32)
 
     for idx_j_start in tl.range(0, T, B1):
         idx_j = idx_j_start + tl.arange(0, B1)
         mask_j = idx_j < T
-        idx_ij = idx_i.expand_dims(1).broadcast_to(B0, B1) * T + idx_j.expand_dims(0).broadcast_to(B0, B1)
-        mask_ij = mask_i.expand_dims(1).broadcast_to(B0, B1) & mask_j.expand_dims(0).broadcast_to(B0, B1)
-        vals = tl.load(x_ptr + idx_ij, mask=mask_ij)    # Shape: [B0, B1]
-        sums += vals.sum(axis=1)
+        idx_ij = idx_i_T + idx_j[None, :]
+        mask_ij = mask_i_col & mask_j[None, :]
+        acc += tl.load(x_ptr + idx_ij, mask=mask_ij, other=0.0)    # Shape: [B0, B1]
 
+    sums = acc.sum(1)   # Shape: [B0]
     tl.store(z_ptr + idx_i, sums, mask=mask_i)
 
     return
@@ -495,42 +532,102 @@ def softmax_spec(x: Float32[4, 200]) -> Float32[4, 200]:
     return x_exp / x_exp.sum(1, keepdim=True)
 
 
+def softmax_long_spec(x: Float32[4, 1000]) -> Float32[4, 1000]:
+    # Rows long enough that softmax_kernel loops over several tiles with every B1 config
+    return softmax_spec(x)
+
+
+@triton.autotune(
+    configs=autotune_configs([
+        triton.Config({"B0": b0, "B1": b1}, num_warps=w, num_stages=s)
+        for b0 in [1, 2, 4, 8]
+        for b1 in [32, 64, 128, 256, 512]
+        for (w, s) in [(2, 2), (4, 2), (4, 3), (8, 3)]
+    ]),
+    key=["T"],
+    prune_configs_by={"early_config_prune": prune_configs_by_T},
+)
 @triton.jit
-def softmax_kernel(x_ptr, z_ptr, N0, N1, T, B0: tl.constexpr, B1: tl.constexpr):
-    """2 loops ver."""
+def softmax_kernel(
+    x_ptr, z_ptr, N0, N1, T, B0: tl.constexpr, B1: tl.constexpr,
+    STAGE_EXP: tl.constexpr = False, MAX_TILES: tl.constexpr = 16,
+):
+    """2 loops ver. (1 loop if a whole row fits in one tile)
+
+    STAGE_EXP=True stages the exponentials in `z` during the first loop, so the second
+    loop rescales them instead of reloading `x` and recomputing exp2. Rows longer than
+    MAX_TILES * B1 fall back to the reload."""
     block_id_i = tl.program_id(0)
     log2_e = 1.44269504
 
     idx_i = block_id_i * B0 + tl.arange(0, B0)  # Shape: [B0]
     mask_i = idx_i < N0
 
-    global_maxs = tl.full([B0], -float("inf"), dtype=tl.float32)
-    sums = tl.zeros([B0], dtype=tl.float32)
-
-    for idx_j_start in tl.range(0, T, B1):
-        idx_j = idx_j_start + tl.arange(0, B1)
+    if T <= B1:
+        # The whole row fits in one tile: load `x` once and normalize it in registers. Only
+        # taken when the autotuner picks B1 >= T (e.g. B1=256 for the puzzle's T=200); in the
+        # two-loop path below long rows read `x` twice, which STAGE_EXP trades for a round
+        # trip of the exponentials through `z`.
+        idx_j = tl.arange(0, B1)
         mask_j = idx_j < T
-        idx_ij = idx_i.expand_dims(1).broadcast_to(B0, B1) * T + idx_j.expand_dims(0).broadcast_to(B0, B1)
-        mask_ij = mask_i.expand_dims(1).broadcast_to(B0, B1) & mask_j.expand_dims(0).broadcast_to(B0, B1)
-        vals = tl.load(x_ptr + idx_ij, mask=mask_ij)    # Shape: [B0, B1]
-
-        # Update MAX
-        last_maxs = global_maxs
-        global_maxs = tl.maximum(global_maxs, vals.max(1))
-        factory = tl.exp2(log2_e * (last_maxs - global_maxs))
+        idx_ij = idx_i[:, None] * T + idx_j[None, :]
+        mask_ij = mask_i[:, None] & mask_j[None, :]
+        vals = tl.load(x_ptr + idx_ij, mask=mask_ij, other=-float("inf"))    # Shape: [B0, B1]
 
-        local_sum = tl.exp2(log2_e * (vals - global_maxs.expand_dims(1).broadcast_to(B0, B1))).sum(1)
-        sums = sums * factory + local_sum
-    
-    for idx_j_start in tl.range(0, T, B1):
-        idx_j = idx_j_start + tl.arange(0, B1)
-        mask_j = idx_j < T
-        idx_ij = idx_i.expand_dims(1).broadcast_to(B0, B1) * T + idx_j.expand_dims(0).broadcast_to(B0, B1)
-        mask_ij = mask_i.expand_dims(1).broadcast_to(B0, B1) & mask_j.expand_dims(0).broadcast_to(B0, B1)
-        vals = tl.load(x_ptr + idx_ij, mask=mask_ij)
-
-        softmaxs = tl.exp2(log2_e * (vals - global_maxs.expand_dims(1).broadcast_to(B0, B1))) / sums.expand_dims(1).broadcast_to(B0, B1)
+        exps = tl.exp2(log2_e * (vals - vals.max(1)[:, None]))
+        softmaxs = exps / exps.sum(1)[:, None]
         tl.store(z_ptr + idx_ij, softmaxs, mask=mask_ij)
+    else:
+        global_maxs = tl.full([B0], -float("inf"), dtype=tl.float32)
+        sums = tl.zeros([B0], dtype=tl.float32)
+
+        # The staged path keeps the running max of every tile in a [B0, MAX_TILES] register
+        # tile, so longer rows fall back to reloading `x` in the second loop.
+        if STAGE_EXP:
+            staged = T <= MAX_TILES * B1
+            idx_tile = tl.arange(0, MAX_TILES)
+            # Running max each tile was exponentiated against, Shape: [B0, MAX_TILES]
+            tile_maxs = tl.full([B0, MAX_TILES], -float("inf"), dtype=tl.float32)
+        else:
+            staged: tl.constexpr = False
+
+        for idx_j_start in tl.range(0, T, B1):
+            idx_j = idx_j_start + tl.arange(0, B1)
+            mask_j = idx_j < T
+            idx_ij = idx_i[:, None] * T + idx_j[None, :]
+            mask_ij = mask_i[:, None] & mask_j[None, :]
+            vals = tl.load(x_ptr + idx_ij, mask=mask_ij, other=-float("inf"))    # Shape: [B0, B1]
+
+            # Update MAX
+            last_maxs = global_maxs
+            global_maxs = tl.maximum(global_maxs, vals.max(1))
+            factory = tl.exp2(log2_e * (last_maxs - global_maxs))
+
+            exps = tl.exp2(log2_e * (vals - global_maxs[:, None]))
+            sums = sums * factory + exps.sum(1)
+            if STAGE_EXP:
+                tile_maxs = tl.where(idx_tile[None, :] == idx_j_start // B1, global_maxs[:, None], tile_maxs)
+                if staged:
+                    tl.store(z_ptr + idx_ij, exps, mask=mask_ij)
+
+        if STAGE_EXP:
+            # Move every tile from its running max to the final max and normalize
+            rescales = tl.exp2(log2_e * (tile_maxs - global_maxs[:, None])) / sums[:, None]   # Shape: [B0, MAX_TILES]
+
+        for idx_j_start in tl.range(0, T, B1):
+            idx_j = idx_j_start + tl.arange(0, B1)
+            mask_j = idx_j < T
+            idx_ij = idx_i[:, None] * T + idx_j[None, :]
+            mask_ij = mask_i[:, None] & mask_j[None, :]
+
+            if staged:
+                exps = tl.load(z_ptr + idx_ij, mask=mask_ij)
+                rescale = tl.where(idx_tile[None, :] == idx_j_start // B1, rescales, 0.0).sum(1)    # Shape: [B0]
+                softmaxs = exps * rescale[:, None]
+            else:
+                vals = tl.load(x_ptr + idx_ij, mask=mask_ij, other=-float("inf"))
+                softmaxs = tl.exp2(log2_e * (vals - global_maxs[:, None])) / sums[:, None]
+            tl.store(z_ptr + idx_ij, softmaxs, mask=mask_ij)
     return
 
 
@@ -572,6 +669,16 @@ def flashatt_spec(
     return (v[None, :] * soft).sum(1)
 
 
+@triton.autotune(
+    configs=autotune_configs([
+        triton.Config({"B0": b0, "B1": b1}, num_warps=w, num_stages=s)
+        for b0 in [64, 32, 16]
+        for b1 in [32, 64, 128, 256, 512]
+        for (w, s) in [(2, 2), (4, 2), (4, 3), (8, 3)]
+    ]),
+    key=["T"],
+    prune_configs_by={"early_config_prune": prune_configs_by_T},
+)
 @triton.jit
 def flashatt_kernel(
     q_ptr, k_ptr, v_ptr, z_ptr, N0, T, B0: tl.constexpr, B1: tl.constexpr
@@ -587,14 +694,18 @@ def flashatt_kernel(
     sums = tl.zeros([B0], dtype=tl.float32)
     result = tl.zeros([B0], dtype=tl.float32)
 
+    # Q does not depend on the K/V block, so load it once outside the loop
+    q = tl.load(q_ptr + idx_i, mask=mask_i)[:, None]  # Shape: [B0, 1]
+
     for idx_j_start in tl.range(0, T, B1):
         idx_j = idx_j_start + tl.arange(0, B1)
         mask_j = idx_j < T
 
-        # Slice Q & K
-        q = tl.load(q_ptr + idx_i, mask=mask_i).expand_dims(1)  # Shape: [B0, 1]
-        k = tl.load(k_ptr + idx_j, mask=mask_j).expand_dims(0)  # Shape: [1, B1]
-        qk = q.broadcast_to(B0, B1) * k.broadcast_to(B0, B1)  # Shape: [B0, B1]
+        # Slice K
+        k = tl.load(k_ptr + idx_j, mask=mask_j)[None, :]  # Shape: [1, B1]
+        qk = q * k  # Shape: [B0, B1]
+        # Padded columns must not contribute to the max or the sum
+        qk = tl.where(mask_j[None, :], qk, -float("inf"))
 
         # Compute factory
         last_maxs = global_maxs
@@ -602,13 +713,12 @@ def flashatt_kernel(
         factory = tl.exp2(log2_e * (last_maxs - global_maxs))   # Shape: [B0]
 
         # Compute expsum
-        global_maxs_expand = global_maxs.expand_dims(1).broadcast_to(B0, B1)    # Shape: [B0, B1]
-        qk_exp = tl.exp2(log2_e * (qk - global_maxs_expand))
+        qk_exp = tl.exp2(log2_e * (qk - global_maxs[:, None]))
         local_sum = qk_exp.sum(1)
         sums = sums * factory + local_sum
 
         # Compute softmax without normalization
-        v = tl.load(v_ptr + idx_j, mask=mask_j).expand_dims(0).broadcast_to(B0, B1)  # Shape: [B0, B1]
+        v = tl.load(v_ptr + idx_j, mask=mask_j, other=0.0)[None, :]  # Shape: [1, B1]
         local_result = (qk_exp * v).sum(1)   # Shape: [B1, 1]
         result = result * factory + local_result
 
@@ -632,7 +742,7 @@ Image `x` is size is `H` by `W` with only 1 channel, and kernel `k` is size `KH`
 
 
 def conv2d_spec(x: Float32[4, 8, 8], k: Float32[4, 4]) -> Float32[4, 8, 8]:
-    z = torch.zeros(4, 8, 8)
+    z = torch.zeros(4, 8, 8, device=x.device)
     x = torch.nn.functional.pad(x, (0, 4, 0, 4, 0, 0), value=0.0)
     # print(x.shape, k.shape)
     for i in range(8):
@@ -641,35 +751,45 @@ def conv2d_spec(x: Float32[4, 8, 8], k: Float32[4, 4]) -> Float32[4, 8, 8]:
     return z
 
 
+@triton.autotune(
+    configs=autotune_configs([
+        triton.Config({"B0": b0}, num_warps=w, num_stages=s)
+        for b0 in [1, 2, 4, 8, 16]
+        for (w, s) in [(1, 2), (2, 2), (4, 2), (4, 3)]
+    ]),
+    key=["N0", "H", "W", "KH", "KW"],
+)
 @triton.jit
 def conv2d_kernel(
-    x_ptr, k_ptr, z_ptr, N0, H, W, KH: tl.constexpr, KW: tl.constexpr, B0: tl.constexpr
+    x_ptr, k_ptr, z_ptr, N0, H: tl.constexpr, W: tl.constexpr, KH: tl.constexpr, KW: tl.constexpr, B0: tl.constexpr
 ):
     block_id_i = tl.program_id(0)
 
-    idx_kernel = KW * tl.arange(0, KH).expand_dims(1).broadcast_to(KH, KW) + tl.arange(0, KW).expand_dims(0).broadcast_to(KH, KW)
-    kernel = tl.load(k_ptr + idx_kernel)    # Shape: [kH, KW]
-
-    offset_b = (block_id_i * B0 + tl.arange(0, B0)).expand_dims([1, 2]).broadcast_to(B0, KH, KW) * H * W
-    mask_b = ((block_id_i * B0 + tl.arange(0, B0)) < N0).expand_dims([1, 2]).broadcast_to(B0, KH, KW)
+    idx_b = block_id_i * B0 + tl.arange(0, B0)  # Shape: [B0]
+    mask_b = idx_b < N0
 
-    for h in tl.range(0, H):
-        offset_h = tl.arange(h, h + KH).expand_dims([0, 2]).broadcast_to(B0, KH, KW) * W
-        mask_h = (tl.arange(h, h + KH) < H).expand_dims([0, 2]).broadcast_to(B0, KH, KW)
+    # The output tile is a [B0, H, W] block and block dimensions must be powers of two
+    tl.static_assert((H & (H - 1)) == 0, "conv2d_kernel needs H to be a power of two")
+    tl.static_assert((W & (W - 1)) == 0, "conv2d_kernel needs W to be a power of two")
+    idx_h = tl.arange(0, H)  # Shape: [H]
+    idx_w = tl.arange(0, W)  # Shape: [W]
 
-        for w in tl.range(0, W):
-            offset_w = tl.arange(w, w + KW).expand_dims([0, 1]).broadcast_to(B0, KH, KW)
-            mask_w = (tl.arange(w, w + KW) < W).expand_dims([0, 1]).broadcast_to(B0, KH, KW)
+    # Offsets of the output tile. Kernel tap (oh, ow) reads the input at the
+    # same offsets shifted by the scalar oh * W + ow, so only that moves in the loop.
+    idx_z = idx_b[:, None, None] * H * W + idx_h[None, :, None] * W + idx_w[None, None, :]
+    mask_b_3d = mask_b[:, None, None]
 
-            offset_tile = offset_b + offset_h + offset_w
-            mask_tile = mask_b & mask_h & mask_w
+    # Accumulate the whole output tile in registers, one kernel tap at a time
+    z_tile = tl.zeros((B0, H, W), dtype=tl.float32)
+    for oh in tl.static_range(KH):
+        mask_h = mask_b_3d & (idx_h + oh < H)[None, :, None]
+        for ow in tl.static_range(KW):
+            kernel = tl.load(k_ptr + oh * KW + ow)  # Scalar
+            mask_x = mask_h & (idx_w + ow < W)[None, None, :]
+            inp = tl.load(x_ptr + idx_z + (oh * W + ow), mask=mask_x, other=0.0)    # Shape: [B0, H, W]
+            z_tile += inp * kernel
 
-            inp = tl.load(x_ptr + offset_tile, mask=mask_tile)  # Shape: [B0, KH, KW]
-            conv = (inp * kernel.expand_dims(0).broadcast_to(B0, KH, KW)).sum(2).sum(1)    # Shape: [B0]
-
-            out_idx = (block_id_i * B0 + tl.arange(0, B0)) * H * W + h * W + w
-            out_mask = (block_id_i * B0 + tl.arange(0, B0)) < N0
-            tl.store(z_ptr + out_idx, conv, mask=out_mask)
+    tl.store(z_ptr + idx_z, z_tile, mask=mask_b_3d)
 
     return
 
@@ -699,6 +819,14 @@ def dot_spec(x: Float32[4, 32, 32], y: Float32[4, 32, 32]) -> Float32[4, 32, 32]
     return x @ y
 
 
+@triton.autotune(
+    configs=autotune_configs([
+        triton.Config({"B0": b0, "B1": b1, "B2": 1, "B_MID": b_mid}, num_warps=w, num_stages=s)
+        for (b0, b1, b_mid) in [(16, 16, 16), (32, 32, 32), (64, 64, 32)]
+        for (w, s) in [(4, 3), (4, 4), (8, 3), (8, 4), (8, 5)]
+    ]),
+    key=["N0", "N1", "MID"],
+)
 @triton.jit
 def dot_kernel(
     x_ptr,  # Shape: BMK[N2, N1, MID]
@@ -712,51 +840,106 @@ def dot_kernel(
     B1: tl.constexpr,
     B2: tl.constexpr,
     B_MID: tl.constexpr,
+    USE_BF16: tl.constexpr = False,
 ):
     # {'N0': 32, 'N1': 32, 'N2': 4, 'MID': 32} {'B0': 16, 'B1': 16, 'B2': 1, 'B_MID': 16}
     block_id_n = tl.program_id(0)   # cdiv(N0, B0)
     block_id_m = tl.program_id(1)   # cdiv(N1, B1)
     block_id_b = tl.program_id(2)   # cdiv(N2, B2)
     
-    # Output Shape: [B2, B1, B0]
-    idx_b = block_id_b * B2 + tl.arange(0, B2)
-    idx_m = block_id_m * B1 + tl.arange(0, B1)
-    idx_n = block_id_n * B0 + tl.arange(0, B0)
+    if B2 == 1:
+        # One batch per program (grid axis 2 has N2 programs): drop the batch axis and
+        # run a plain 2-D matmul on the batch's [N1, MID] x [MID, N0] slices.
+        A_block_ptr = tl.make_block_ptr(
+            base=x_ptr + block_id_b * N1 * MID,
+            shape=(N1, MID),
+            strides=(MID, 1),
+            offsets=(block_id_m * B1, 0),
+            block_shape=(B1, B_MID),
+            order=(1, 0),
+        )
+        B_block_ptr = tl.make_block_ptr(
+            base=y_ptr + block_id_b * MID * N0,
+            shape=(MID, N0),
+            strides=(N0, 1),
+            offsets=(0, block_id_n * B0),
+            block_shape=(B_MID, B0),
+            order=(1, 0),
+        )
 
-    tile = tl.zeros([B2, B1, B0], dtype=tl.float32)
+        tile = tl.zeros([B1, B0], dtype=tl.float32)
+
+        for k in tl.range(0, MID, B_MID):
+            # Load A, Shape [B1, B_MID]
+            A = tl.load(A_block_ptr, boundary_check=(0, 1), padding_option="zero")
+            # Load B, Shape [B_MID, B0]
+            B = tl.load(B_block_ptr, boundary_check=(0, 1), padding_option="zero")
+
+            if USE_BF16:
+                tile += tl.dot(A.to(tl.bfloat16), B.to(tl.bfloat16), out_dtype=tl.float32)
+            else:
+                tile += tl.dot(A, B, input_precision="tf32", out_dtype=tl.float32)
+
+            A_block_ptr = tl.advance(A_block_ptr, (0, B_MID))
+            B_block_ptr = tl.advance(B_block_ptr, (B_MID, 0))
+
+        # Output Shape: [B1, B0]
+        C_block_ptr = tl.make_block_ptr(
+            base=z_ptr + block_id_b * N1 * N0,
+            shape=(N1, N0),
+            strides=(N0, 1),
+            offsets=(block_id_m * B1, block_id_n * B0),
+            block_shape=(B1, B0),
+            order=(1, 0),
+        )
+        tl.store(C_block_ptr, tile, boundary_check=(0, 1))
+    else:
+        # Block pointers keep one base + strides per operand; the K loop only advances them
+        A_block_ptr = tl.make_block_ptr(
+            base=x_ptr,
+            shape=(N2, N1, MID),
+            strides=(N1 * MID, MID, 1),
+            offsets=(block_id_b * B2, block_id_m * B1, 0),
+            block_shape=(B2, B1, B_MID),
+            order=(2, 1, 0),
+        )
+        B_block_ptr = tl.make_block_ptr(
+            base=y_ptr,
+            shape=(N2, MID, N0),
+            strides=(MID * N0, N0, 1),
+            offsets=(block_id_b * B2, 0, block_id_n * B0),
+            block_shape=(B2, B_MID, B0),
+            order=(2, 1, 0),
+        )
 
-    for k in tl.range(0, MID, B_MID):
-        # Load A, Shape [B2, B1, B_MID]
-        idx_k = k + tl.arange(0, B_MID)
-        idx_A = idx_b.expand_dims([1, 2]).broadcast_to(B2, B1, B_MID) * N1 * MID + \
-                idx_m.expand_dims([0, 2]).broadcast_to(B2, B1, B_MID) * MID + \
-                idx_k.expand_dims([0, 1]).broadcast_to(B2, B1, B_MID)
-        msk_A = (idx_b < N2).expand_dims([1, 2]).broadcast_to(B2, B1, B_MID) & \
-                (idx_m < N1).expand_dims([0, 2]).broadcast_to(B2, B1, B_MID) & \
-                (idx_k < MID).expand_dims([0, 1]).broadcast_to(B2, B1, B_MID)
-        
-        A = tl.load(x_ptr + idx_A, mask=msk_A)
-        
-        # Load B, Shape [B2, B_MID, B0]
-        idx_B = idx_b.expand_dims([1, 2]).broadcast_to(B2, B_MID, B0) * MID * N0 + \
-                idx_k.expand_dims([0, 2]).broadcast_to(B2, B_MID, B0) * N0 + \
-                idx_n.expand_dims([0, 1]).broadcast_to(B2, B_MID, B0)
-        msk_B = (idx_b < N2).expand_dims([1, 2]).broadcast_to(B2, B_MID, B0) & \
-                (idx_k < MID).expand_dims([0, 2]).broadcast_to(B2, B_MID, B0) & \
-                (idx_n < N0).expand_dims([0, 1]).broadcast_to(B2, B_MID, B0)
-        
-        B = tl.load(y_ptr + idx_B, mask=msk_B)
-
-        # MMA
-        tile += tl.dot(A, B)
-
-    idx_C = idx_b.expand_dims([1, 2]).broadcast_to(B2, B1, B0) * N1 * N0 + \
-            idx_m.expand_dims([0, 2]).broadcast_to(B2, B1, B0) * N0 + \
-            idx_n.expand_dims([0, 1]).broadcast_to(B2, B1, B0)
-    msk_C = (idx_b < N2).expand_dims([1, 2]).broadcast_to(B2, B1, B0) & \
-            (idx_m < N1).expand_dims([0, 2]).broadcast_to(B2, B1, B0) & \
-            (idx_n < N0).expand_dims([0, 1]).broadcast_to(B2, B1, B0)
-    tl.store(z_ptr + idx_C, tile, mask=msk_C)
+        tile = tl.zeros([B2, B1, B0], dtype=tl.float32)
+
+        for k in tl.range(0, MID, B_MID):
+            # Load A, Shape [B2, B1, B_MID]
+            A = tl.load(A_block_ptr, boundary_check=(0, 1, 2), padding_option="zero")
+            # Load B, Shape [B2, B_MID, B0]
+            B = tl.load(B_block_ptr, boundary_check=(0, 1, 2), padding_option="zero")
+
+            # MMA, always accumulated in fp32. BF16 operands double the tensor core
+            # throughput at lower precision; "tf32x3" is the accuracy-sensitive fp32 option.
+            if USE_BF16:
+                tile += tl.dot(A.to(tl.bfloat16), B.to(tl.bfloat16), out_dtype=tl.float32)
+            else:
+                tile += tl.dot(A, B, input_precision="tf32", out_dtype=tl.float32)
+
+            A_block_ptr = tl.advance(A_block_ptr, (0, 0, B_MID))
+            B_block_ptr = tl.advance(B_block_ptr, (0, B_MID, 0))
+
+        # Output Shape: [B2, B1, B0]
+        C_block_ptr = tl.make_block_ptr(
+            base=z_ptr,
+            shape=(N2, N1, N0),
+            strides=(N1 * N0, N0, 1),
+            offsets=(block_id_b * B2, block_id_m * B1, block_id_n * B0),
+            block_shape=(B2, B1, B0),
+            order=(2, 1, 0),
+        )
+        tl.store(C_block_ptr, tile, boundary_check=(0, 1, 2))
     return
 
 
@@ -795,7 +978,7 @@ def quant_dot_spec(
     offset = offset.view(32, 1)
 
     def extract(x):
-        over = torch.arange(8) * 4
+        over = torch.arange(8, device=x.device) * 4
         mask = 2**4 - 1
         return (x[..., None] >> over) & mask
 
@@ -806,6 +989,14 @@ def quant_dot_spec(
     return (scale * (extract(weight).view(-1, 64) - offset)) @ activation
 
 
+@triton.autotune(
+    configs=autotune_configs([
+        triton.Config({"B0": b0, "B1": b1, "B_MID": b_mid}, num_warps=w, num_stages=s)
+        for (b0, b1, b_mid) in [(16, 16, 64), (16, 16, 32), (32, 32, 32), (32, 32, 64), (64, 32, 64), (64, 64, 64)]
+        for (w, s) in [(4, 3), (4, 4), (8, 3), (8, 4), (8, 5)]
+    ]),
+    key=["N0", "N1", "MID"],
+)
 @triton.jit
 def quant_dot_kernel(
     scale_ptr,      # Shape: [32, 8] --> [N0, MID // GROUP]
@@ -815,7 +1006,7 @@ def quant_dot_kernel(
     z_ptr,          # Shape: M * N [32, 32] --> [N0, N1]
     N0,
     N1,
-    MID,
+    MID: tl.constexpr,
     B0: tl.constexpr,
     B1: tl.constexpr,
     B_MID: tl.constexpr,
@@ -841,229 +1032,189 @@ def quant_dot_kernel(
 
     tl.static_assert(MID % GROUP == 0, "MID % GROUP != 0")
 
+    BITS: tl.constexpr = 32 // FPINT
+    tl.static_assert(BITS == 4, "byte-wise unpack expects 4-bit weights")
+
+    # MID % B_MID == 0 is asserted above, so no K tile needs a K mask: every load mask
+    # is the K-invariant row (or column) mask, built once here.
+    msk_row = msk_m[:, None]    # Shape: [B0, 1]
+    msk_col = msk_n[None, :]    # Shape: [1, B1]
+    idx_weight_row = idx_m[:, None] * (MID // FPINT)    # Shape: [B0, 1]
+    idx_scale_row = idx_m[:, None] * (MID // GROUP)     # Shape: [B0, 1]
+
+    # The packed offsets of a row do not depend on k. When all of them fit into a
+    # single int32, load that word once and only shift the right nibbles out of it
+    # inside the K loop.
+    OFFSET_WORDS: tl.constexpr = MID // GROUP // FPINT
+    idx_offset_row = idx_m[:, None] * OFFSET_WORDS  # Shape: [B0, 1]
+    if OFFSET_WORDS == 1:
+        offset_packed = tl.load(offset_ptr + idx_offset_row, mask=msk_row)   # Shape: [B0, 1]
+
     for k in tl.range(0, MID, B_MID):
         # Load Weight [B0, B_MID // FPINT] --> [B0, B_MID]
         idx_scaled_k = (k // FPINT) + tl.arange(0, B_MID // FPINT)   # Shape: [B_MID // FPINT]
-        mask_scaled_k = idx_scaled_k < (MID // FPINT)
-        idx_quant_weight = idx_m.expand_dims(1).broadcast_to(B0, B_MID // FPINT) * (MID // FPINT) + \
-                            idx_scaled_k.expand_dims(0).broadcast_to(B0, B_MID // FPINT)    # Shape: [B0, B_MID // FPINT]
-        msk_quant_weight = msk_m.expand_dims(1).broadcast_to(B0, B_MID // FPINT) & \
-                            mask_scaled_k.expand_dims(0).broadcast_to(B0, B_MID // FPINT)
-        quant_weight = tl.load(weight_ptr + idx_quant_weight, mask=msk_quant_weight)    # Shape: [B0, B_MID // FPINT]
-        BITS = 32 // FPINT
-        quant_weight = (quant_weight.expand_dims(2) >> (tl.arange(0, FPINT) * (32 // FPINT))) & ((1 << BITS) - 1)   # Shape: [B0, B_MID // FPINT, FPINT]
-        quant_weight = quant_weight.reshape(B0, B_MID)
-
-        # Load Scale
+        idx_quant_weight = idx_weight_row + idx_scaled_k[None, :]    # Shape: [B0, B_MID // FPINT]
+        quant_weight = tl.load(weight_ptr + idx_quant_weight, mask=msk_row)    # Shape: [B0, B_MID // FPINT]
+        # Split every int32 into its 4 bytes, then every byte into its low and high nibble.
+        # Shift as uint32 so that the top byte is not sign extended.
+        quant_bytes = (quant_weight.to(tl.uint32, bitcast=True)[:, :, None] >> (tl.arange(0, 4) * 8)[None, None, :]) & 0xFF # Shape: [B0, B_MID // FPINT, 4]
+        quant_weight = tl.interleave(quant_bytes & 0x0F, quant_bytes >> 4)   # Shape: [B0, B_MID // FPINT, FPINT]
+        quant_weight = quant_weight.to(tl.int32).reshape(B0, B_MID)
+
+        # Scale and offset hold one value per GROUP weights, so only load
+        # B_MID // GROUP of them per row and broadcast them over the group.
         idx_k = k + tl.arange(0, B_MID) # Shape: [B_MID]
-        idx_scale = idx_k // GROUP  # Shape: [B_MID]
-        # idx_scale: [0,0,0,0,0,0,0,0,1,1,1,1,1,1,1,1,......,7,7,7,7,7,7,7,7]
-        msk_scale = idx_scale < (MID // GROUP)
-        idx_scale_factory = idx_m.expand_dims(1).broadcast_to(B0, B_MID) * (MID // GROUP) + \
-                            idx_scale.expand_dims(0).broadcast_to(B0, B_MID)
-        msk_scale_factory = msk_m.expand_dims(1).broadcast_to(B0, B_MID) & \
-                            msk_scale.expand_dims(0).broadcast_to(B0, B_MID)
-        scale = tl.load(scale_ptr + idx_scale_factory, mask=msk_scale_factory)  # Shape: [B0, B_MID]
-
-        # Load Offset
-        # Offset Shape: [B0, B_MID // GROUP // FPINT]
-        idx_offset = idx_k // GROUP // FPINT    # Shape:[B0, B_MID]
-        # idx_offset: full of zeros
-        msk_offset = idx_offset < (B_MID // GROUP // FPINT)
-        _idx_offset = idx_m.expand_dims(1).broadcast_to(B0, B_MID) * (MID // GROUP // FPINT) + \
-                        idx_offset.expand_dims(0).broadcast_to(B0, B_MID)
-        _msk_offset = msk_m.expand_dims(1).broadcast_to(B0, B_MID) & \
-                        msk_offset.expand_dims(0).broadcast_to(B0, B_MID)
-        offset = tl.load(offset_ptr + _idx_offset, mask=_msk_offset)    # Shape: [B0, B_MID]
-        offset_shifts = (tl.arange(0, FPINT) * (32 // FPINT)).expand_dims(1).broadcast_to(FPINT, GROUP).reshape(B_MID)
-        # offset_shifts: [0,0,0,0,0,0,0,0,0,4,4,4,4,4,4,4,4,......,28,28,28,28,28,28,28,28]
-        offset = (offset >> offset_shifts) & ((1 << BITS) - 1)
-
-        # dequantization
-        dequant_weight = scale * (quant_weight - offset)
+        idx_group = (k // GROUP) + tl.arange(0, B_MID // GROUP)  # Shape: [B_MID // GROUP]
 
-        # Load Activation Shape: [B_MID, B1]
-        idx_act = idx_k.expand_dims(1).broadcast_to(B_MID, B1) * N1 + \
-                    idx_n.expand_dims(0).broadcast_to(B_MID, B1)
-        msk_act = (idx_k < MID).expand_dims(1).broadcast_to(B_MID, B1) & \
-                    msk_n.expand_dims(0).broadcast_to(B_MID, B1)
-        act = tl.load(activation_ptr + idx_act, mask=msk_act)
-
-        tile += tl.dot(dequant_weight, act)
-
-    idx_out = idx_m.expand_dims(1).broadcast_to(B0, B1) * N1 + \
-                idx_n.expand_dims(0).broadcast_to(B0, B1)
-    msk_out = msk_m.expand_dims(1).broadcast_to(B0, B1) & \
-                msk_n.expand_dims(0).broadcast_to(B0, B1)
-    tl.store(z_ptr + idx_out, tile, mask=msk_out)
-    return
+        # Load Scale, Shape: [B0, B_MID // GROUP]
+        idx_scale = idx_scale_row + idx_group[None, :]
+        scale = tl.load(scale_ptr + idx_scale, mask=msk_row)
 
+        # Load Offset, Shape: [B0, B_MID // GROUP]
+        # Every int32 packs the 4-bit offsets of FPINT consecutive groups
+        if OFFSET_WORDS == 1:
+            offset = offset_packed
+        else:
+            offset = tl.load(offset_ptr + idx_offset_row + (idx_group // FPINT)[None, :], mask=msk_row)
+        offset = (offset >> ((idx_group % FPINT) * BITS)[None, :]) & ((1 << BITS) - 1)
 
-def run_demos():
-    run_demo1()
-    run_demo2()
-    run_demo3()
-    run_demo4()
+        # dequantization, per group: [B0, B_MID // GROUP, 1] * ([B0, B_MID // GROUP, GROUP] - [B0, B_MID // GROUP, 1])
+        dequant_weight = scale[:, :, None] * (quant_weight.reshape(B0, B_MID // GROUP, GROUP) - offset[:, :, None])
+        dequant_weight = dequant_weight.reshape(B0, B_MID)
 
+        # Load Activation Shape: [B_MID, B1]
+        idx_act = idx_k[:, None] * N1 + idx_n[None, :]
+        act = tl.load(activation_ptr + idx_act, mask=msk_col)
 
-def run_puzzles(args, puzzles: List[int]):
-    print_log = args.log
-    device = args.device
+        # Both operands are fp32 after dequantization, so there is no int8 MMA path to take
+        tile += tl.dot(dequant_weight, act, input_precision="ieee", out_dtype=tl.float32)
 
-    if 1 in puzzles:
-        print("Puzzle #1:")
-        ok = test(
-            add_kernel,
-            add_spec,
-            nelem={"N0": 32},
-            print_log=print_log,
-            device=device,
-        )
-        print_end_line()
-        if not ok:
-            return
-    if 2 in puzzles:
-        print("Puzzle #2:")
-        ok = test(
-            add_mask2_kernel,
-            add2_spec,
-            nelem={"N0": 200},
-            print_log=print_log,
-            device=device,
-        )
-        print_end_line()
-        if not ok:
-            return
-    if 3 in puzzles:
-        print("Puzzle #3:")
-        ok = test(
-            add_vec_kernel,
-            add_vec_spec,
-            nelem={"N0": 32, "N1": 32},
-            print_log=print_log,
-            device=device,
-        )
-        print_end_line()
-        if not ok:
-            return
-    if 4 in puzzles:
-        print("Puzzle #4:")
-        ok = test(
-            add_vec_block_kernel,
-            add_vec_block_spec,
-            nelem={"N0": 100, "N1": 90},
-            print_log=print_log,
-            device=device,
-        )
-        print_end_line()
-        if not ok:
-            return
-    if 5 in puzzles:
-        print("Puzzle #5:")
-        ok = test(
-            mul_relu_block_kernel,
-            mul_relu_block_spec,
-            nelem={"N0": 100, "N1": 90},
-            print_log=print_log,
-            device=device,
-        )
-        print_end_line()
-        if not ok:
-            return
-    if 6 in puzzles:
-        print("Puzzle #6:")
-        ok = test(
-            mul_relu_block_back_kernel,
-            mul_relu_block_back_spec,
-            nelem={"N0": 100, "N1": 90},
-            print_log=print_log,
-            device=device,
-        )
-        print_end_line()
-        if not ok:
-            return
-    if 7 in puzzles:
-        print("Puzzle #7:")
-        ok = test(
-            sum_kernel,
-            sum_spec,
-            B={"B0": 1, "B1": 32},
-            nelem={"N0": 4, "N1": 32, "T": 200},
-            print_log=print_log,
-            device=device,
-        )
-        print_end_line()
-        if not ok:
-            return
-    if 8 in puzzles:
-        print("Puzzle #8:")
-        ok = test(
-            softmax_kernel,
-            softmax_spec,
-            B={"B0": 1, "B1": 32},
-            nelem={"N0": 4, "N1": 32, "T": 200},
-            print_log=print_log,
-            device=device,
-        )
-        print_end_line()
-        if not ok:
-            return
-    if 9 in puzzles:
-        print("Puzzle #9:")
-        ok = test(
-            flashatt_kernel,
-            flashatt_spec,
-            B={"B0": 64, "B1": 32},
-            nelem={"N0": 200, "T": 200},
-            print_log=print_log,
-            device=device,
-        )
-        print_end_line()
-        if not ok:
-            return
-    if 10 in puzzles:
-        print("Puzzle #10:")
-        ok = test(
-            conv2d_kernel,
-            conv2d_spec,
-            B={"B0": 1},
-            nelem={"N0": 4, "H": 8, "W": 8, "KH": 4, "KW": 4},
-            print_log=print_log,
-            device=device,
-        )
-        print_end_line()
-        if not ok:
-            return
-    if 11 in puzzles:
-        print("Puzzle #11:")
-        ok = test(
-            dot_kernel,
-            dot_spec,
-            B={"B0": 16, "B1": 16, "B2": 1, "B_MID": 16},
-            nelem={"N0": 32, "N1": 32, "N2": 4, "MID": 32},
-            print_log=print_log,
-            device=device,
-        )
+    idx_out = idx_m[:, None] * N1 + idx_n[None, :]
+    tl.store(z_ptr + idx_out, tile, mask=msk_row & msk_col)
+    return
+
+
+def run_demos(device="cpu"):
+    run_demo1(device)
+    run_demo2(device)
+    run_demo3(device)
+    run_demo4(device)
+
+
+# Puzzle id -> (name, kernel, spec, B, nelem). B=None keeps the default block sizes of `test`;
+# puzzles 7-12 are autotuned, so their block sizes come from the kernel configs.
+PUZZLES = {
+    1: ("Puzzle #1", add_kernel, add_spec, None, {"N0": 32}),
+    2: ("Puzzle #2", add_mask2_kernel, add2_spec, None, {"N0": 200}),
+    3: ("Puzzle #3", add_vec_kernel, add_vec_spec, None, {"N0": 32, "N1": 32}),
+    4: ("Puzzle #4", add_vec_block_kernel, add_vec_block_spec, None, {"N0": 100, "N1": 90}),
+    5: ("Puzzle #5", mul_relu_block_kernel, mul_relu_block_spec, None, {"N0": 100, "N1": 90}),
+    6: ("Puzzle #6", mul_relu_block_back_kernel, mul_relu_block_back_spec, None, {"N0": 100, "N1": 90}),
+    7: ("Puzzle #7", sum_kernel, sum_spec, None, {"N0": 4, "N1": 32, "T": 200}),
+    8: ("Puzzle #8", softmax_kernel, softmax_spec, None, {"N0": 4, "N1": 32, "T": 200}),
+    9: ("Puzzle #9", flashatt_kernel, flashatt_spec, None, {"N0": 200, "T": 200}),
+    10: ("Puzzle #10", conv2d_kernel, conv2d_spec, None, {"N0": 4, "H": 8, "W": 8, "KH": 4, "KW": 4}),
+    11: ("Puzzle #11", dot_kernel, dot_spec, None, {"N0": 32, "N1": 32, "N2": 4, "MID": 32}),
+    12: ("Puzzle #12", quant_dot_kernel, quant_dot_spec, None, {"N0": 32, "N1": 32, "MID": 64}),
+}
+
+
+# Checks of optional kernel paths that no puzzle takes, run with `--variants`:
+# name -> (kernel, spec, B, nelem).
+VARIANTS = {
+    # MAX_TILES=32 keeps every softmax tile staged, MAX_TILES=1 forces the reload fallback
+    "softmax_kernel (STAGE_EXP)": (softmax_kernel, softmax_long_spec, {"STAGE_EXP": True, "MAX_TILES": 32}, {"N0": 4, "N1": 32, "T": 1000}),
+    "softmax_kernel (STAGE_EXP, fallback)": (softmax_kernel, softmax_long_spec, {"STAGE_EXP": True, "MAX_TILES": 1}, {"N0": 4, "N1": 32, "T": 1000}),
+    # Every dot_kernel config pins B2=1, so launch the kernel without the autotuner to cover
+    # the batched path (two batches per program).
+    "dot_kernel (B2=2)": (dot_kernel.fn, dot_spec, {"B0": 16, "B1": 16, "B2": 2, "B_MID": 16}, {"N0": 32, "N1": 32, "N2": 4, "MID": 32}),
+}
+
+
+# Heuristic rank of every puzzle for `--order cheap_first` (not measured): elementwise
+# puzzles first, then the reductions, then the matmul-style puzzles.
+_COST = {1: 1, 2: 1, 3: 1, 4: 2, 5: 2, 6: 2, 7: 3, 8: 5, 9: 6, 10: 6, 11: 8, 12: 10}
+
+
+def iter_puzzles(args, puzzles: List[int]):
+    """Yield (name, kernel, spec, test kwargs) for the known puzzles, in run order."""
+    puzzles = [puzzle_id for puzzle_id in puzzles if puzzle_id in PUZZLES]
+    if args.order == "cheap_first":
+        puzzles.sort(key=lambda puzzle_id: _COST[puzzle_id])
+    for puzzle_id in puzzles:
+        name, kernel, spec, B, nelem = PUZZLES[puzzle_id]
+        kwargs = {"nelem": nelem, "device": args.device}
+        if B:
+            kwargs["B"] = B
+        yield name, kernel, spec, kwargs
+
+
+def run_puzzles(args, puzzles: List[int]) -> List[str]:
+    """Run the given puzzles and return the names of the failed ones."""
+    plan = list(iter_puzzles(args, puzzles))
+    run = run_puzzles_parallel if args.parallel and args.device == "cuda" else run_puzzles_sequential
+    if not args.all or args.log:
+        return run(args, plan)
+    # Running everything without --log: collect the report and write it out in one go
+    # (also when a puzzle raises) instead of flushing stdout line by line.
+    buffer = io.StringIO()
+    try:
+        with redirect_stdout(buffer):
+            return run(args, plan)
+    finally:
+        sys.stdout.write(buffer.getvalue())
+        sys.stdout.flush()
+
+
+def run_variants(args) -> List[str]:
+    """Run the VARIANTS checks and return the names of the failed ones."""
+    plan = [(name, kernel, spec, {"nelem": nelem, "B": B, "device": args.device})
+            for name, (kernel, spec, B, nelem) in VARIANTS.items()]
+    return run_puzzles_sequential(args, plan)
+
+
+def run_puzzles_sequential(args, plan):
+    failed = []
+    for name, kernel, spec, kwargs in plan:
+        print(name + ":")
+        ok = test(kernel, spec, print_log=args.log, **kwargs)
         print_end_line()
         if not ok:
-            return
-    if 12 in puzzles:
-        print("Puzzle #12:")
-        ok = test(
-            quant_dot_kernel,
-            quant_dot_spec,
-            B={"B0": 16, "B1": 16, "B_MID": 64},
-            nelem={"N0": 32, "N1": 32, "MID": 64},
-            print_log=print_log,
-            device=device,
-        )
+            failed.append(name)
+            if args.fail_fast:
+                break
+    report(failed)
+    return failed
+
+
+def run_puzzles_parallel(args, plan):
+    # Puzzles are independent: launch each one on its own stream, synchronize once,
+    # then check them all. They have all run by then, so --fail-fast does not apply.
+    pending = []
+    for name, kernel, spec, kwargs in plan:
+        with torch.cuda.stream(torch.cuda.Stream()):
+            pending.append((name, test_async(kernel, spec, print_log=args.log, **kwargs)))
+    torch.cuda.synchronize()
+
+    failed = []
+    for name, launched in pending:
+        print(name + ":")
+        if not check(launched):
+            failed.append(name)
         print_end_line()
-        if not ok:
-            return
-    print("All tests passed!")
+    report(failed)
+    return failed
 
 
-if __name__ == "__main__":
+def report(failed):
+    if failed:
+        print("FAILED:", ", ".join(failed))
+    else:
+        print("All tests passed!")
+
+
+@lru_cache(maxsize=1)
+def _build_parser():
     parser = argparse.ArgumentParser()
 
     parser.add_argument("-p", "--puzzle", type=int, metavar="N", help="Run Puzzle #N")
@@ -1071,30 +1222,56 @@ if __name__ == "__main__":
         "-a",
         "--all",
         action="store_true",
-        help="Run all Puzzles. Stop at first failure.",
+        help="Run all Puzzles and report every failure.",
+    )
+    parser.add_argument(
+        "-x",
+        "--fail-fast",
+        action="store_true",
+        help="Stop at the first failed puzzle.",
     )
     parser.add_argument("-l", "--log", action="store_true", help="Print log messages.")
+    parser.add_argument(
+        "--order",
+        choices=["declared", "cheap_first"],
+        default="declared",
+        help="Run order of the puzzles: as declared, or a heuristic cheapest-first order.",
+    )
+    parser.add_argument(
+        "--parallel",
+        action="store_true",
+        help="GPU only: launch all puzzles on separate CUDA streams, then check them. Ignores --fail-fast.",
+    )
+    parser.add_argument(
+        "--variants",
+        action="store_true",
+        help="Run the checks of optional kernel paths that the puzzles do not take.",
+    )
     parser.add_argument(
         "-i",
         "--intro",
         action="store_true",
         help="Run all demos in the introduction part.",
     )
+    return parser
+
 
+if __name__ == "__main__":
+    parser = _build_parser()
     args = parser.parse_args()
 
     if os.getenv("TRITON_INTERPRET", "0") == "1":
-        torch.set_default_device("cpu")
         args.device = "cpu"
     else:  # GPU mode
-        torch.set_default_device("cuda")
         args.device = "cuda"
 
     if args.intro:
-        run_demos()
+        run_demos(args.device)
     elif args.all:
-        run_puzzles(args, list(range(1, 13)))
+        sys.exit(1 if run_puzzles(args, list(PUZZLES)) else 0)
+    elif args.variants:
+        sys.exit(1 if run_variants(args) else 0)
     elif args.puzzle:
-        run_puzzles(args, [int(args.puzzle)])
+        sys.exit(1 if run_puzzles(args, [int(args.puzzle)]) else 0)
     else:
         parser.print_help()
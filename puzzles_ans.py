@@ -1,6 +1,10 @@
 import argparse
+from contextlib import redirect_stdout
+from functools import lru_cache
+import io
 from typing import List
 import os
+import sys
 
 import torch
 import triton
@@ -9,7 +13,7 @@ import triton.language as tl
 # Local imports
 from display import print_end_line
 from tensor_type import Float32, Int32
-from test_puzzle import test
+from test_puzzle import test, test_async, check
 
 
 """
@@ -65,9 +69,9 @@ def demo1(x_ptr):
     print(x)
 
 
-def run_demo1():
+def run_demo1(device="cpu"):
     print("Demo1 Output: ")
-    demo1[(1, 1, 1)](torch.ones(4, 3))
+    demo1[(1, 1, 1)](torch.ones(4, 3, device=device))
     print_end_line()
 
 
@@ -112,9 +116,9 @@ def demo2(x_ptr):
     print(x)
 
 
-def run_demo2():
+def run_demo2(device="cpu"):
     print("Demo2 Output: ")
-    demo2[(1, 1, 1)](torch.ones(4, 4))
+    demo2[(1, 1, 1)](torch.ones(4, 4, device=device))
     print_end_line()
 
 
@@ -148,9 +152,9 @@ def demo3(z_ptr):
     z = tl.store(z_ptr + range, 10, range < 5)
 
 
-def run_demo3():
+def run_demo3(device="cpu"):
     print("Demo3 Output: ")
-    z = torch.ones(4, 3)
+    z = torch.ones(4, 3, device=device)
     demo3[(1, 1, 1)](z)
     print(z)
     print_end_line()
@@ -187,9 +191,9 @@ def demo4(x_ptr):
     print("Print for each", pid, x)
 
 
-def run_demo4():
+def run_demo4(device="cpu"):
     print("Demo4 Output: ")
-    x = torch.ones(2, 4, 4)
+    x = torch.ones(2, 4, 4, device=device)
     demo4[(3, 1, 1)](x)
     print_end_line()
 
@@ -679,7 +683,7 @@ Image `x` is size is `H` by `W` with only 1 channel, and kernel `k` is size `KH`
 
 
 def conv2d_spec(x: Float32[4, 8, 8], k: Float32[4, 4]) -> Float32[4, 8, 8]:
-    z = torch.zeros(4, 8, 8)
+    z = torch.zeros(4, 8, 8, device=x.device)
     x = torch.nn.functional.pad(x, (0, 4, 0, 4, 0, 0), value=0.0)
     # print(x.shape, k.shape)
     for i in range(8):
@@ -835,7 +839,7 @@ def quant_dot_spec(
     offset = offset.view(32, 1)
 
     def extract(x):
-        over = torch.arange(8) * 4
+        over = torch.arange(8, device=x.device) * 4
         mask = 2**4 - 1
         return (x[..., None] >> over) & mask
 
@@ -925,171 +929,107 @@ def quant_dot_kernel(
     return
 
 
-def run_demos():
-    run_demo1()
-    run_demo2()
-    run_demo3()
-    run_demo4()
-
-
-def run_puzzles(args, puzzles: List[int]):
-    print_log = args.log
-    device = args.device
-
-    if 1 in puzzles:
-        print("Puzzle #1:")
-        ok = test(
-            add_kernel,
-            add_spec,
-            nelem={"N0": 32},
-            print_log=print_log,
-            device=device,
-        )
-        print_end_line()
-        if not ok:
-            return
-    if 2 in puzzles:
-        print("Puzzle #2:")
-        ok = test(
-            add_mask2_kernel,
-            add2_spec,
-            nelem={"N0": 200},
-            print_log=print_log,
-            device=device,
-        )
-        print_end_line()
-        if not ok:
-            return
-    if 3 in puzzles:
-        print("Puzzle #3:")
-        ok = test(
-            add_vec_kernel,
-            add_vec_spec,
-            nelem={"N0": 32, "N1": 32},
-            print_log=print_log,
-            device=device,
-        )
-        print_end_line()
-        if not ok:
-            return
-    if 4 in puzzles:
-        print("Puzzle #4:")
-        ok = test(
-            add_vec_block_kernel,
-            add_vec_block_spec,
-            nelem={"N0": 100, "N1": 90},
-            print_log=print_log,
-            device=device,
-        )
-        print_end_line()
-        if not ok:
-            return
-    if 5 in puzzles:
-        print("Puzzle #5:")
-        ok = test(
-            mul_relu_block_kernel,
-            mul_relu_block_spec,
-            nelem={"N0": 100, "N1": 90},
-            print_log=print_log,
-            device=device,
-        )
-        print_end_line()
-        if not ok:
-            return
-    if 6 in puzzles:
-        print("Puzzle #6:")
-        ok = test(
-            mul_relu_block_back_kernel,
-            mul_relu_block_back_spec,
-            nelem={"N0": 100, "N1": 90},
-            print_log=print_log,
-            device=device,
-        )
-        print_end_line()
-        if not ok:
-            return
-    if 7 in puzzles:
-        print("Puzzle #7:")
-        ok = test(
-            sum_kernel,
-            sum_spec,
-            B={"B0": 1, "B1": 32},
-            nelem={"N0": 4, "N1": 32, "T": 200},
-            print_log=print_log,
-            device=device,
-        )
-        print_end_line()
-        if not ok:
-            return
-    if 8 in puzzles:
-        print("Puzzle #8:")
-        ok = test(
-            softmax_kernel,
-            softmax_spec,
-            B={"B0": 1, "B1": 32},
-            nelem={"N0": 4, "N1": 32, "T": 200},
-            print_log=print_log,
-            device=device,
-        )
+def run_demos(device="cpu"):
+    run_demo1(device)
+    run_demo2(device)
+    run_demo3(device)
+    run_demo4(device)
+
+
+# Puzzle id -> (name, kernel, spec, B, nelem). B=None keeps the default block sizes of `test`.
+PUZZLES = {
+    1: ("Puzzle #1", add_kernel, add_spec, None, {"N0": 32}),
+    2: ("Puzzle #2", add_mask2_kernel, add2_spec, None, {"N0": 200}),
+    3: ("Puzzle #3", add_vec_kernel, add_vec_spec, None, {"N0": 32, "N1": 32}),
+    4: ("Puzzle #4", add_vec_block_kernel, add_vec_block_spec, None, {"N0": 100, "N1": 90}),
+    5: ("Puzzle #5", mul_relu_block_kernel, mul_relu_block_spec, None, {"N0": 100, "N1": 90}),
+    6: ("Puzzle #6", mul_relu_block_back_kernel, mul_relu_block_back_spec, None, {"N0": 100, "N1": 90}),
+    7: ("Puzzle #7", sum_kernel, sum_spec, {"B0": 1, "B1": 32}, {"N0": 4, "N1": 32, "T": 200}),
+    8: ("Puzzle #8", softmax_kernel, softmax_spec, {"B0": 1, "B1": 32}, {"N0": 4, "N1": 32, "T": 200}),
+    9: ("Puzzle #9", flashatt_kernel, flashatt_spec, {"B0": 64, "B1": 32}, {"N0": 200, "T": 200}),
+    10: ("Puzzle #10", conv2d_kernel, conv2d_spec, {"B0": 1}, {"N0": 4, "H": 8, "W": 8, "KH": 4, "KW": 4}),
+    11: ("Puzzle #11", dot_kernel, dot_spec, {"B0": 16, "B1": 16, "B2": 1, "B_MID": 16}, {"N0": 32, "N1": 32, "N2": 4, "MID": 64}),
+    12: ("Puzzle #12", quant_dot_kernel, quant_dot_spec, {"B0": 16, "B1": 16, "B_MID": 64}, {"N0": 32, "N1": 32, "MID": 64}),
+}
+
+
+# Heuristic rank of every puzzle for `--order cheap_first` (not measured): elementwise
+# puzzles first, then the reductions, then the matmul-style puzzles.
+_COST = {1: 1, 2: 1, 3: 1, 4: 2, 5: 2, 6: 2, 7: 3, 8: 5, 9: 6, 10: 6, 11: 8, 12: 10}
+
+
+def iter_puzzles(args, puzzles: List[int]):
+    """Yield (name, kernel, spec, test kwargs) for the known puzzles, in run order."""
+    puzzles = [puzzle_id for puzzle_id in puzzles if puzzle_id in PUZZLES]
+    if args.order == "cheap_first":
+        puzzles.sort(key=lambda puzzle_id: _COST[puzzle_id])
+    for puzzle_id in puzzles:
+        name, kernel, spec, B, nelem = PUZZLES[puzzle_id]
+        kwargs = {"nelem": nelem, "device": args.device}
+        if B:
+            kwargs["B"] = B
+        yield name, kernel, spec, kwargs
+
+
+def run_puzzles(args, puzzles: List[int]) -> List[str]:
+    """Run the given puzzles and return the names of the failed ones."""
+    plan = list(iter_puzzles(args, puzzles))
+    run = run_puzzles_parallel if args.parallel and args.device == "cuda" else run_puzzles_sequential
+    if not args.all or args.log:
+        return run(args, plan)
+    # Running everything without --log: collect the report and write it out in one go
+    # (also when a puzzle raises) instead of flushing stdout line by line.
+    buffer = io.StringIO()
+    try:
+        with redirect_stdout(buffer):
+            return run(args, plan)
+    finally:
+        sys.stdout.write(buffer.getvalue())
+        sys.stdout.flush()
+
+
+def run_puzzles_sequential(args, plan):
+    failed = []
+    for name, kernel, spec, kwargs in plan:
+        print(name + ":")
+        ok = test(kernel, spec, print_log=args.log, **kwargs)
         print_end_line()
         if not ok:
-            return
-    if 9 in puzzles:
-        print("Puzzle #9:")
-        ok = test(
-            flashatt_kernel,
-            flashatt_spec,
-            B={"B0": 64, "B1": 32},
-            nelem={"N0": 200, "T": 200},
-            print_log=print_log,
-            device=device,
-        )
-        print_end_line()
-        if not ok:
-            return
-    if 10 in puzzles:
-        print("Puzzle #10:")
-        ok = test(
-            conv2d_kernel,
-            conv2d_spec,
-            B={"B0": 1},
-            nelem={"N0": 4, "H": 8, "W": 8, "KH": 4, "KW": 4},
-            print_log=print_log,
-            device=device,
-        )
-        print_end_line()
-        if not ok:
-            return
-    if 11 in puzzles:
-        print("Puzzle #11:")
-        ok = test(
-            dot_kernel,
-            dot_spec,
-            B={"B0": 16, "B1": 16, "B2": 1, "B_MID": 16},
-            nelem={"N0": 32, "N1": 32, "N2": 4, "MID": 64},
-            print_log=print_log,
-            device=device,
-        )
+            failed.append(name)
+            if args.fail_fast:
+                break
+    report(failed)
+    return failed
+
+
+def run_puzzles_parallel(args, plan):
+    # Puzzles are independent: launch each one on its own stream, synchronize once,
+    # then check them all. They have all run by then, so --fail-fast does not apply.
+    pending = []
+    for name, kernel, spec, kwargs in plan:
+        with torch.cuda.stream(torch.cuda.Stream()):
+            pending.append((name, test_async(kernel, spec, print_log=args.log, **kwargs)))
+    torch.cuda.synchronize()
+
+    failed = []
+    for name, launched in pending:
+        print(name + ":")
+        if not check(launched):
+            failed.append(name)
         print_end_line()
-        if not ok:
-            return
-    if 12 in puzzles:
-        print("Puzzle #12:")
-        ok = test(
-            quant_dot_kernel,
-            quant_dot_spec,
-            B={"B0": 16, "B1": 16, "B_MID": 64},
-            nelem={"N0": 32, "N1": 32, "MID": 64},
-            print_log=print_log,
-            device=device,
-        )
-        print_end_line()
-        if not ok:
-            return
-    print("All tests passed!")
+    report(failed)
+    return failed
 
 
-if __name__ == "__main__":
+def report(failed):
+    if failed:
+        print("FAILED:", ", ".join(failed))
+    else:
+        print("All tests passed!")
+
+
+@lru_cache(maxsize=1)
+def _build_parser():
     parser = argparse.ArgumentParser()
 
     parser.add_argument("-p", "--puzzle", type=int, metavar="N", help="Run Puzzle #N")
@@ -1097,30 +1037,49 @@ if __name__ == "__main__":
         "-a",
         "--all",
         action="store_true",
-        help="Run all Puzzles. Stop at first failure.",
+        help="Run all Puzzles and report every failure.",
+    )
+    parser.add_argument(
+        "-x",
+        "--fail-fast",
+        action="store_true",
+        help="Stop at the first failed puzzle.",
     )
     parser.add_argument("-l", "--log", action="store_true", help="Print log messages.")
+    parser.add_argument(
+        "--order",
+        choices=["declared", "cheap_first"],
+        default="declared",
+        help="Run order of the puzzles: as declared, or a heuristic cheapest-first order.",
+    )
+    parser.add_argument(
+        "--parallel",
+        action="store_true",
+        help="GPU only: launch all puzzles on separate CUDA streams, then check them. Ignores --fail-fast.",
+    )
     parser.add_argument(
         "-i",
         "--intro",
         action="store_true",
         help="Run all demos in the introduction part.",
     )
+    return parser
+
 
+if __name__ == "__main__":
+    parser = _build_parser()
     args = parser.parse_args()
 
     if os.getenv("TRITON_INTERPRET", "0") == "1":
-        torch.set_default_device("cpu")
         args.device = "cpu"
     else:  # GPU mode
-        torch.set_default_device("cuda")
         args.device = "cuda"
 
     if args.intro:
-        run_demos()
+        run_demos(args.device)
     elif args.all:
-        run_puzzles(args, list(range(1, 13)))
+        sys.exit(1 if run_puzzles(args, list(range(1, 13))) else 0)
     elif args.puzzle:
-        run_puzzles(args, [int(args.puzzle)])
+        sys.exit(1 if run_puzzles(args, [int(args.puzzle)]) else 0)
     else:
         parser.print_help()
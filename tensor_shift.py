@@ -1,10 +1,60 @@
+import os
+
 import torch
+import triton
+import triton.language as tl
+
+# Shift amounts per (device, dtype), built once in the input dtype so the result keeps it
+# (an int32 input is not promoted to int64)
+_OVER_CACHE = {}
+
+def tensor_shift(x, debug=False):
+  over = _OVER_CACHE.get((x.device, x.dtype))
+  if over is None:
+    over = torch.arange(0, 32, 4, dtype=x.dtype, device=x.device)
+    _OVER_CACHE[(x.device, x.dtype)] = over
+  out = torch.empty((*x.shape, 8), dtype=x.dtype, device=x.device)
+  torch.bitwise_right_shift(x[..., None], over, out=out)
+  if debug:
+    # Printing a CUDA tensor synchronizes the device
+    print(over)
+    print(out.shape)
+  return out
+
+def _tensor_shift_fused(x):
+  # No cache lookup, out= or prints: Inductor folds the arange * 4 into the shift
+  # and emits a single elementwise kernel for the whole graph
+  over = torch.arange(8, dtype=torch.int32, device=x.device) * 4
+  return x[..., None] >> over
 
-def tensor_shift(x):
-  over = torch.arange(8) * 4
-  print(over)
-  x = x[..., None] >> over
-  print(x.shape)
+# Compiled lazily on the first call
+tensor_shift_compiled = torch.compile(_tensor_shift_fused, fullgraph=True, dynamic=False)
+
+@triton.jit
+def shift8_kernel(x_ptr, out_ptr, N, BLOCK: tl.constexpr):
+  pid = tl.program_id(0)
+  offs = pid * BLOCK + tl.arange(0, BLOCK)
+  mask = offs < N
+  # Read every element once; the 8 shift amounts are unrolled into immediates
+  x = tl.load(x_ptr + offs, mask=mask)
+  for i in tl.static_range(8):
+    tl.store(out_ptr + offs * 8 + i, x >> (4 * i), mask=mask)
+
+def tensor_shift_triton(x, BLOCK=1024):
+  x = x.contiguous()
+  out = torch.empty((*x.shape, 8), dtype=x.dtype, device=x.device)
+  N = x.numel()
+  shift8_kernel[(triton.cdiv(N, BLOCK),)](x, out, N, BLOCK=BLOCK)
+  return out
 
 if __name__ == '__main__':
-  tensor_shift(torch.randint(-1000000, 1000000, (16, 8), dtype=torch.int32))
+  out = tensor_shift_compiled(torch.randint(-1000000, 1000000, (16, 8), dtype=torch.int32))
+  print(out.shape)
+
+  # shift8_kernel needs a GPU, or the CPU interpreter with TRITON_INTERPRET=1
+  device = "cpu" if os.getenv("TRITON_INTERPRET", "0") == "1" else "cuda"
+  if device == "cpu" or torch.cuda.is_available():
+    for dtype in (torch.int32, torch.int64):
+      x = torch.randint(-1000000, 1000000, (16, 8), dtype=dtype, device=device)
+      assert torch.equal(tensor_shift_triton(x), tensor_shift(x)), dtype
+    print("tensor_shift_triton matches tensor_shift")
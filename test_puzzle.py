@@ -6,16 +6,52 @@ import torch
 
 from interpreter import patch, collect_grid
 
+class PendingTest:
+    """A launched puzzle whose output has not been checked yet."""
+
+    def __init__(self, puzzle_spec, tt_args, nelem, B, print_log, device, grid_record):
+        self.puzzle_spec = puzzle_spec
+        self.tt_args = tt_args
+        self.nelem = nelem
+        self.B = B
+        self.print_log = print_log
+        self.device = device
+        self.grid_record = grid_record
+
+
 def test(puzzle, puzzle_spec, nelem={}, B={"B0": 32}, print_log=False, device="cpu") -> bool:
     """Test a single puzzle."""
+    return check(test_async(puzzle, puzzle_spec, nelem, B, print_log, device))
+
+
+def test_async(puzzle, puzzle_spec, nelem={}, B={"B0": 32}, print_log=False, device="cpu") -> PendingTest:
+    """Launch a single puzzle without waiting for it. Pass the result to `check`."""
+    torch.manual_seed(0)
+    tt_args, B, grid = _prepare(puzzle, puzzle_spec, nelem, B, device)
+
+    # triton_viz.trace(puzzle)[grid](*tt_args, **B, **nelem))
+    with patch():
+        puzzle[grid](*tt_args, **B, **nelem)
+    if isinstance(puzzle, triton.runtime.Autotuner):
+        B.update(puzzle.best_config.kwargs)
+
+    # The interpreter only keeps the records of the last launch, so grab them now
+    grid_record = collect_grid() if device != "cuda" else None
+    return PendingTest(puzzle_spec, tt_args, nelem, B, print_log, device, grid_record)
 
+
+def _prepare(puzzle, puzzle_spec, nelem, B, device):
+    """Block sizes, random inputs (output buffer last) and launch grid of a puzzle."""
     B = dict(B)
     if "N1" in nelem and "B1" not in B:
         B["B1"] = 32
     if "N2" in nelem and "B2" not in B:
         B["B2"] = 32
+    if isinstance(puzzle, triton.runtime.Autotuner):
+        # Block sizes covered by the autotuner configs are picked by the autotuner
+        tuned = {k for config in puzzle.configs for k in config.kwargs}
+        B = {k: v for k, v in B.items() if k not in tuned}
 
-    torch.manual_seed(0)
     signature = inspect.signature(puzzle_spec)
     args = {}
     for n, p in signature.parameters.items():
@@ -36,11 +72,14 @@ def test(puzzle, puzzle_spec, nelem={}, B={"B0": 32}, print_log=False, device="c
 
     #for k, v in args.items():
     #    print(k, v)
-    
-    # triton_viz.trace(puzzle)[grid](*tt_args, **B, **nelem))
-    with patch():
-        puzzle[grid](*tt_args, **B, **nelem)
-    
+    return tt_args, B, grid
+
+
+def check(pending: PendingTest) -> bool:
+    """Compare a launched puzzle with its spec and report invalid memory accesses."""
+    puzzle_spec, tt_args, nelem, B = pending.puzzle_spec, pending.tt_args, pending.nelem, pending.B
+    print_log, device = pending.print_log, pending.device
+
     z = tt_args[-1]
     tt_args = tt_args[:-1]
     z_ = puzzle_spec(*tt_args)
@@ -59,7 +98,7 @@ def test(puzzle, puzzle_spec, nelem={}, B={"B0": 32}, print_log=False, device="c
         print("Memory access detection is not supported on GPU. Skip checking.")
         return match
 
-    _, _, failures, access_offsets = collect_grid()
+    _, _, failures, access_offsets = pending.grid_record
     mem_emoji = "✅" if not failures else "❌"
 
     if failures: